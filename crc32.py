@@ -1,31 +1,215 @@
 import argparse
+import array
+import os
+import struct
 import zlib
 import sys
 
+# NumPy + Numba are optional and slow to import, so the table-driven CRCs (standard and
+# custom polynomials) only load them (see _load_jit) for inputs of at least JIT_MIN_SIZE bytes
+JIT_MIN_SIZE = 2 * 1024 * 1024
+_jit = None  # (numpy, reversed kernel, standard kernel) once loaded, False if not installed
+
+# Lookup tables for the reversed (lsb-first) CRC32, keyed by polynomial
+_crc32_tables = {}
+
+# Lookup tables for the standard (msb-first) CRC32, keyed by polynomial
+_crc32_standard_tables = {}
+
+# Inputs at least this large are split across cores for custom polynomials
+PARALLEL_MIN_SIZE = 4 * 1024 * 1024
+
 def calculate_crc32_standard(data, polynomial=0x04C11DB7, initial_value=0xFFFFFFFF):
     """Calculates CRC32 using the standard polynomial (forward bit order)."""
+    table = _get_crc32_standard_table(polynomial)
+    jit = _load_jit() if len(data) >= JIT_MIN_SIZE else None
+    if jit is not None:
+        # JIT-compiled table loop over the raw bytes
+        np, _, standard_kernel = jit
+        crc = standard_kernel(np.frombuffer(data, dtype=np.uint8), np.frombuffer(table, dtype=np.uint32),
+                              np.int64(initial_value))
+        return int(crc) ^ initial_value
+
+    # Table-driven path (Sarwate): one lookup per byte instead of eight shifts
     crc = initial_value
     for byte in data:
-        crc ^= byte << 24  # Place the byte in the leftmost position of the 32-bit CRC
-        for _ in range(8):
-            if crc & 0x80000000:  # Check the leftmost bit
-                crc = (crc << 1) ^ polynomial
-            else:
-                crc <<= 1
-        crc &= 0xFFFFFFFF  # Ensure CRC remains 32-bit
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ byte]
     return crc ^ initial_value
 
 def calculate_crc32_reversed(data, polynomial=0xEDB88320, initial_value=0xFFFFFFFF):
     """Calculates CRC32 using the reversed polynomial (zlib, PNG, ZIP)."""
+    if polynomial == 0xEDB88320 and initial_value == 0xFFFFFFFF:
+        # zlib implements this exact CRC in C, so hand the whole buffer over
+        return zlib.crc32(data) & 0xFFFFFFFF
+
+    if len(data) >= JIT_MIN_SIZE:
+        jit = _load_jit()
+        if jit is not None:
+            return _crc32_reversed_jit(data, polynomial, initial_value, jit)
+
+    # Table-driven path for custom polynomials (slice-by-8)
+    t0, t1, t2, t3, t4, t5, t6, t7 = _get_crc32_tables(polynomial)
     crc = initial_value
-    for byte in data:
-        crc ^= byte  # XOR byte into the rightmost position
+    n = len(data)
+    end = n - n % 8
+    for i in range(0, end, 8):
+        lo, hi = struct.unpack_from('<II', data, i)
+        lo ^= crc
+        crc = (t7[lo & 0xFF] ^ t6[(lo >> 8) & 0xFF] ^ t5[(lo >> 16) & 0xFF] ^ t4[lo >> 24] ^
+               t3[hi & 0xFF] ^ t2[(hi >> 8) & 0xFF] ^ t1[(hi >> 16) & 0xFF] ^ t0[hi >> 24])
+    for byte in data[end:]:
+        crc = t0[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ initial_value
+
+def calculate_crc32_reversed_parallel(data, polynomial=0xEDB88320, initial_value=0xFFFFFFFF, workers=None):
+    """Calculates the reversed-polynomial CRC32 over contiguous shards in parallel and combines them."""
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor  # Only needed on this path
+
+    workers = workers or os.cpu_count() or 1
+    shard_size = -(-len(data) // workers)  # Round up so at most `workers` shards are made
+    if workers == 1 or shard_size == 0:
+        return calculate_crc32_reversed(data, polynomial, initial_value)
+    view = memoryview(data)
+    shards = [view[i:i + shard_size] for i in range(0, len(data), shard_size)]
+
+    # The JIT kernel releases the GIL, so threads can share the buffer; otherwise each
+    # shard is copied to a worker process to get around the GIL
+    jit = _load_jit()
+    if jit is not None:
+        with ThreadPoolExecutor(workers) as executor:
+            crcs = list(executor.map(lambda shard: _crc32_reversed_jit(shard, polynomial, initial_value, jit), shards))
+    else:
+        shards = [bytes(shard) for shard in shards]
+        with ProcessPoolExecutor(workers) as executor:
+            crcs = list(executor.map(calculate_crc32_reversed, shards,
+                                     [polynomial] * len(shards), [initial_value] * len(shards)))
+
+    crc = crcs[0]
+    for shard, shard_crc in zip(shards[1:], crcs[1:]):
+        crc = crc32_combine(crc, shard_crc, len(shard), polynomial)
+    return crc
+
+def _crc32_reversed_jit(data, polynomial, initial_value, jit):
+    """Runs the reversed-polynomial CRC32 through the JIT-compiled table kernel."""
+    np, table_kernel, _ = jit
+    table = np.frombuffer(_get_crc32_tables(polynomial)[0], dtype=np.uint32)
+    crc = table_kernel(np.frombuffer(data, dtype=np.uint8), table, np.uint32(initial_value))
+    return int(crc) ^ initial_value
+
+def crc32_combine(crc1, crc2, len2, polynomial=0xEDB88320):
+    """
+    Combines the CRC32 of A (crc1) and of B (crc2) into the CRC32 of A followed by B, where B is len2 bytes.
+
+    CRCs are linear over GF(2), so crc1 only has to be advanced over len2 zero bytes and XORed with crc2.
+    This holds for any polynomial in reversed bit order as long as the initial value and final XOR match,
+    as they do in calculate_crc32_reversed. Follows zlib's crc32_combine (repeated matrix squaring).
+    """
+    if len2 <= 0:
+        return crc1
+
+    odd = [polynomial] + [1 << n for n in range(31)]  # Operator for one zero bit
+    even = _gf2_matrix_square(odd)  # Two zero bits
+    odd = _gf2_matrix_square(even)  # Four zero bits
+
+    # Apply len2 zero bytes to crc1, one bit of len2 at a time
+    while True:
+        even = _gf2_matrix_square(odd)  # The first square gives the operator for one zero byte
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+
+        odd = _gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+
+    return crc1 ^ crc2
+
+def _gf2_matrix_times(matrix, vector):
+    """Multiplies a 32x32 GF(2) matrix (list of column bitmasks) by a 32-bit vector."""
+    result = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return result
+
+def _gf2_matrix_square(matrix):
+    """Squares a 32x32 GF(2) matrix."""
+    return [_gf2_matrix_times(matrix, column) for column in matrix]
+
+def _build_table(polynomial):
+    """Builds the 256-entry lookup table for the reversed polynomial (Sarwate)."""
+    table = array.array('I', bytes(4 * 256))
+    for i in range(256):
+        crc = i
         for _ in range(8):
-            if crc & 1:  # Check the rightmost bit
+            if crc & 1:
                 crc = (crc >> 1) ^ polynomial
             else:
                 crc >>= 1
-    return crc ^ initial_value
+        table[i] = crc
+    return table
+
+def _get_crc32_standard_table(polynomial):
+    """Returns the 256-entry lookup table for the standard polynomial, building it on first use."""
+    table = _crc32_standard_tables.get(polynomial)
+    if table is None:
+        table = array.array('I', bytes(4 * 256))
+        for i in range(256):
+            crc = i << 24  # Place the byte in the leftmost position of the 32-bit CRC
+            for _ in range(8):
+                if crc & 0x80000000:  # Check the leftmost bit
+                    crc = ((crc << 1) ^ polynomial) & 0xFFFFFFFF
+                else:
+                    crc = (crc << 1) & 0xFFFFFFFF
+            table[i] = crc
+        _crc32_standard_tables[polynomial] = table
+    return table
+
+def _get_crc32_tables(polynomial):
+    """Returns the eight slice-by-8 tables for the polynomial, building them on first use."""
+    tables = _crc32_tables.get(polynomial)
+    if tables is None:
+        t0 = _build_table(polynomial)
+        tables = [t0]
+        for _ in range(7):
+            prev = tables[-1]
+            tables.append(array.array('I', (t0[c & 0xFF] ^ (c >> 8) for c in prev)))
+        _crc32_tables[polynomial] = tables
+    return tables
+
+def _crc32_table_kernel(buf, table, crc):
+    """Runs the byte-at-a-time table CRC over a uint8 array (compiled by _load_jit)."""
+    for b in buf:
+        crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc
+
+def _crc32_standard_table_kernel(buf, table, crc):
+    """Runs the msb-first byte-at-a-time table CRC over a uint8 array (compiled by _load_jit)."""
+    for b in buf:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[((crc >> 24) ^ b) & 0xFF]
+    return crc
+
+def _load_jit():
+    """Imports NumPy and Numba and JIT-wraps the kernels on first use; returns None if they aren't installed."""
+    global _jit
+    if _jit is None:
+        try:
+            import numpy as np
+            from numba import njit
+        except ImportError:
+            _jit = False
+        else:
+            _jit = (np, njit(cache=True, nogil=True)(_crc32_table_kernel),
+                    njit(cache=True)(_crc32_standard_table_kernel))
+    return _jit or None
 
 def main():
     # Set up argument parsing
@@ -65,7 +249,7 @@ def main():
         print(f"CRC32 (Standard Polynomial 0x04C11DB7) for '{args.file}': {crc:08x}")
 
     elif args.polynomial_type == "reversed":
-        crc = calculate_crc32_reversed(data)
+        crc = zlib.crc32(data) & 0xFFFFFFFF
         print(f"CRC32 (Reversed Polynomial 0xEDB88320) for '{args.file}': {crc:08x}")
 
     elif args.polynomial_type == "custom":
@@ -81,7 +265,10 @@ def main():
             sys.exit(1)
 
         # Calculate CRC32 using the custom polynomial (reversed bit order)
-        crc = calculate_crc32_reversed(data, polynomial=custom_polynomial)
+        if len(data) >= PARALLEL_MIN_SIZE:
+            crc = calculate_crc32_reversed_parallel(data, polynomial=custom_polynomial)
+        else:
+            crc = calculate_crc32_reversed(data, polynomial=custom_polynomial)
         print(f"CRC32 (Custom Polynomial {args.custom_polynomial}) for '{args.file}': {crc:08x}")
     else:
         print(f"Error: Unknown polynomial type '{args.polynomial_type}'.")
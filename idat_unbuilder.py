@@ -1,87 +1,134 @@
 import zlib
 import argparse
+import mmap
 import os
+import stat
 import struct
 import sys
 
+# libdeflate bindings are optional; zlib is used when they aren't installed
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
+# PNG files must start with this 8-byte signature
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
 # Define the functions
 
 def find_idat_chunks(file_data, include_magic=False):
     """
     Finds and extracts IDAT chunks and their CRC32 checksums from the binary file data.
+    The PNG signature is expected to have been checked already.
 
-    :param file_data: The binary data of the PNG file.
+    :param file_data: The binary data of the PNG file, ideally as a memoryview so slices don't copy.
     :param include_magic: Whether to include the 'IDAT' magic bytes in the output.
-    :return: A list of tuples containing (IDAT chunk data, CRC32 checksum).
+    :return: A list of tuples containing (IDAT chunk data, CRC32 checksum), as slices of file_data.
     """
-    # PNG files must start with an 8-byte signature
-    png_signature = b'\x89PNG\r\n\x1a\n'
-    if file_data[:8] != png_signature:
-        print("Error: The file is not a valid PNG.")
-        return []
-
     idat_chunks = []  # List to store extracted IDAT chunks and their CRC32 values
-    idx = 8  # Start searching after the PNG header
-
-    while idx < len(file_data):
-        # Search for the IDAT marker in the binary data
-        idx = file_data.find(b'IDAT', idx)
-        if idx == -1:
-            break  # No more IDAT chunks found
-
-        # Read the 4 bytes before the 'IDAT' marker to get the chunk length
-        length_start = idx - 4
-        if length_start < 0:
-            print(f"Error: Invalid IDAT chunk found at index {idx}.")
-            break
+    idx = 8  # Start walking chunks after the PNG header
 
-        # Extract the chunk length (4 bytes, big-endian)
-        length = struct.unpack('>I', file_data[length_start:idx])[0]
+    # Walk the chunks using their length fields; each chunk is length, type, data, CRC32
+    while idx + 8 <= len(file_data):
+        # Extract the chunk length (4 bytes, big-endian) and type (4 bytes)
+        length = struct.unpack_from('>I', file_data, idx)[0]
+        chunk_type = file_data[idx + 4:idx + 8]
 
         # Calculate the start and end indices of the chunk data
-        data_start = idx + 4  # After 'IDAT' marker
+        data_start = idx + 8  # After length and type
         data_end = data_start + length
 
         # Ensure the end index is within the file bounds
         if data_end + 4 > len(file_data):  # Include 4 bytes for the CRC32
-            print(f"Error: Incomplete IDAT chunk at index {idx}.")
+            print(f"Error: Incomplete chunk at index {idx}.")
             break
 
-        # Extract the chunk data and optionally include the 'IDAT' marker
-        chunk_data = file_data[idx:data_end] if include_magic else file_data[data_start:data_end]
+        if chunk_type == b'IDAT':
+            # Extract the chunk data and optionally include the 'IDAT' marker
+            chunk_data = file_data[idx + 4:data_end] if include_magic else file_data[data_start:data_end]
 
-        # Extract the CRC32 bytes (4 bytes right after the chunk data)
-        crc32_start = data_end
-        crc32_end = crc32_start + 4
-        crc32_bytes = file_data[crc32_start:crc32_end]
+            # Extract the CRC32 bytes (4 bytes right after the chunk data)
+            crc32_bytes = file_data[data_end:data_end + 4]
 
-        # Append the IDAT chunk and its CRC32 to the list
-        idat_chunks.append((chunk_data, crc32_bytes))
+            # Append the IDAT chunk and its CRC32 to the list
+            idat_chunks.append((chunk_data, crc32_bytes))
+        elif chunk_type == b'IEND':
+            break  # Nothing follows the IEND chunk
 
-        # Skip over this IDAT chunk and its CRC32 for the next iteration
-        idx = crc32_end  # Move past the chunk data and CRC32
+        # Skip over this chunk and its CRC32 for the next iteration
+        idx = data_end + 4
 
     return idat_chunks
 
 
-def decompress_idat_chunks(idat_chunks):
+def decompress_idat_chunks(idat_chunks, max_output_len=None):
     """
-    Decompresses a list of IDAT chunks using zlib.
+    Decompresses a list of IDAT chunks using libdeflate if available, otherwise zlib.
 
     :param idat_chunks: A list of tuples containing (IDAT chunk data, CRC32 checksum).
-    :return: Decompressed IDAT data as a bytes object.
+    :param max_output_len: Expected decompressed size from IHDR, required for libdeflate; only used as a hint.
+    :return: Decompressed IDAT data as a bytes-like object.
     """
-    combined_data = b''.join([chunk for chunk, crc in idat_chunks])  # Combine all IDAT chunk data
+    compressed_len = sum(len(chunk) for chunk, crc in idat_chunks)
+    print(f"[i] info : Total length of combined IDAT : {compressed_len} bytes")
+
+    # IHDR dimensions may be bogus, so never trust them beyond deflate's maximum 1032:1 ratio
+    if max_output_len:
+        max_output_len = min(max_output_len, 1032 * compressed_len)
+
+    # libdeflate is much faster on whole buffers but must know the output size up front
+    if deflate is not None and max_output_len:
+        try:
+            # libdeflate needs one contiguous input, but a lone chunk can be passed as-is
+            if len(idat_chunks) == 1:
+                combined_data = idat_chunks[0][0]
+            else:
+                combined_data = b''.join([chunk for chunk, crc in idat_chunks])
+            return deflate.zlib_decompress(combined_data, max_output_len)
+        except deflate.DeflateError as e:
+            print(f"[i] info : libdeflate failed ({e}), falling back to zlib")
+
+    # Stream the chunks through one decompressor instead of joining them into a single buffer,
+    # filling an output buffer sized up front (slice assignment grows it if the size was too small)
+    written = 0
     try:
-        print(f"[i] info : Total length of combined IDAT : {len(combined_data)} bytes")
-        decompressed_data = zlib.decompress(combined_data)
-        return decompressed_data
+        decompressed_data = bytearray(max_output_len or 0)
+        for piece in iter_decompressed_idat(idat_chunks):
+            decompressed_data[written:written + len(piece)] = piece
+            written += len(piece)
     except zlib.error as e:
         print(f"Error: Failed to decompress IDAT data: {e}")
         return None
+    except (MemoryError, OverflowError) as e:
+        print(f"Error: Failed to decompress IDAT data: out of memory ({type(e).__name__})")
+        return None
+
+    del decompressed_data[written:]  # Trim to the actual decompressed size
+    return decompressed_data
+
+
+def iter_decompressed_idat(idat_chunks, max_length=0):
+    """
+    Decompresses IDAT chunks with a single zlib decompressobj, yielding the output piece by piece.
+
+    :param idat_chunks: A list of tuples containing (IDAT chunk data, CRC32 checksum).
+    :param max_length: Maximum size of each yielded piece, 0 for no limit.
+    :return: A generator of decompressed data pieces; raises zlib.error on a bad or truncated stream.
+    """
+    decompressor = zlib.decompressobj()
+    for chunk, crc in idat_chunks:
+        data = chunk
+        while data:
+            yield decompressor.decompress(data, max_length)
+            data = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+    if not decompressor.eof:
+        raise zlib.error("incomplete or truncated stream")
 
 
-def unfilter_idat_data(decompressed_data, width, bytes_per_pixel, height, verbose= False):
+def unfilter_idat_data(decompressed_data, width, bytes_per_pixel, height, verbose= False, stride=None):
     """
     Unfilters the decompressed IDAT data based on the filter type for each scanline.
 
@@ -89,97 +136,116 @@ def unfilter_idat_data(decompressed_data, width, bytes_per_pixel, height, verbos
     :param width: The width of the image in pixels.
     :param bytes_per_pixel: The number of bytes representing a single pixel.
     :param height: The height of the image in pixels.
-    :return: Unfiltered image data as a bytes object.
+    :param stride: Bytes per scanline; defaults to width * bytes_per_pixel.
+    :return: Unfiltered image data as a bytes object, or None if unfiltering fails.
     """
     sys.path.append('lib')
     from unfilter_decompressed_idat import unfilter_scanlines
 
     print(f"[i] DEBUG: Unfiltering decompressed data with width={width}, height={height}, bytes_per_pixel={bytes_per_pixel}")
-    unfiltered_data = unfilter_scanlines(decompressed_data, width, bytes_per_pixel, height, verbose)
+    try:
+        unfiltered_data = unfilter_scanlines(decompressed_data, width, bytes_per_pixel, height, verbose, stride)
+    except ValueError as e:
+        # Too few scanlines for the IHDR dimensions, or an unknown filter type
+        print(f"Error: Failed to unfilter IDAT data: {e}")
+        return None
     return unfiltered_data
 
 
+def decompress_and_unfilter_idat_chunks(idat_chunks, width, bytes_per_pixel, height, verbose= False, stride=None):
+    """
+    Decompresses and unfilters the IDAT chunks in one pass, one scanline at a time.
+
+    :param idat_chunks: A list of tuples containing (IDAT chunk data, CRC32 checksum).
+    :param width: The width of the image in pixels.
+    :param bytes_per_pixel: The number of bytes representing a single pixel.
+    :param height: The height of the image in pixels.
+    :param stride: Bytes per scanline; defaults to width * bytes_per_pixel.
+    :return: Unfiltered image data as a bytes object, or None if decompression or unfiltering fails.
+    """
+    sys.path.append('lib')
+    from unfilter_decompressed_idat import unfilter_scanlines_stream
+
+    if stride is None:
+        stride = width * bytes_per_pixel
+
+    compressed_len = sum(len(chunk) for chunk, crc in idat_chunks)
+    print(f"[i] info : Total length of combined IDAT : {compressed_len} bytes")
+
+    # The output is sized from IHDR before anything is decompressed, so reject dimensions
+    # that deflate's maximum 1032:1 ratio could never fill
+    if height * (1 + stride) > 1032 * compressed_len:
+        print(f"Error: Failed to unfilter IDAT data: IHDR claims {height} scanlines of {stride} bytes, "
+              f"more than {compressed_len} compressed bytes can hold")
+        return None
+
+    print(f"[i] DEBUG: Unfiltering decompressed data with width={width}, height={height}, bytes_per_pixel={bytes_per_pixel}")
+    try:
+        # Decompress at most one scanline (filter byte included) at a time
+        pieces = iter_decompressed_idat(idat_chunks, stride + 1)
+        return unfilter_scanlines_stream(pieces, width, bytes_per_pixel, height, verbose, stride)
+    except zlib.error as e:
+        print(f"Error: Failed to decompress IDAT data: {e}")
+        return None
+    except ValueError as e:
+        # Too few scanlines for the IHDR dimensions, or an unknown filter type
+        print(f"Error: Failed to unfilter IDAT data: {e}")
+        return None
+
+
 def write_result_to_file(data, output_file, dirpath= '.'):
     """
     Writes the given data to a specified output file.
 
-    :param data: Data to be written to the file.
+    :param data: Data to be written to the file, or a list of pieces written back to back.
     :param output_file: Path to the output file.
+    :param dirpath: Directory for the output file; callers create it once up front.
     """
-    # Create the directory if it doesn't exist
-    os.makedirs(dirpath, exist_ok=True)
-
     # Construct the full file path
     full_file_path = os.path.join(dirpath, output_file)
 
     with open(full_file_path, 'wb') as out_f:
-        out_f.write(data)
+        if isinstance(data, list):
+            out_f.writelines(data)  # Avoids concatenating the pieces into a new buffer first
+        else:
+            out_f.write(data)
     print(f"Data saved to '{full_file_path}'")
 
 
-def get_png_ihdr_info(png_file):
+def get_png_ihdr_info(file_data):
     """
-    Extracts the IHDR chunk information (width, height, bit depth, color type) from the PNG file.
+    Extracts the IHDR chunk information (width, height, bit depth, color type) from the PNG file data.
+    The PNG signature is expected to have been checked already.
 
-    :param png_file: Path to the PNG file.
-    :return: (width, height, bytes_per_pixel)
+    :param file_data: The binary data of the PNG file.
+    :return: (width, height, bytes_per_pixel, stride)
     """
-    try:
-        with open(png_file, 'rb') as file:
-            # Read and check the PNG signature (first 8 bytes)
-            png_signature = file.read(8)
-            if png_signature != b'\x89PNG\r\n\x1a\n':
-                print(f"Error: '{png_file}' is not a valid PNG file.")
-                return None, None, None
-
-            # Loop through the chunks to find the IHDR chunk
-            while True:
-                # Read the length (4 bytes) and type (4 bytes)
-                chunk_length_data = file.read(4)
-                chunk_type = file.read(4)
-
-                if len(chunk_length_data) < 4 or len(chunk_type) < 4:
-                    print("Error: Unexpected end of file.")
-                    return None, None, None
-
-                # Convert chunk length from bytes to integer
-                chunk_length = struct.unpack('>I', chunk_length_data)[0]
-
-                # Check if it's the IHDR chunk
-                if chunk_type == b'IHDR':
-                    print(f"[i] Found IHDR chunk at offset {file.tell() - 8}")
-                    
-                    # Read the IHDR chunk data (13 bytes)
-                    ihdr_data = file.read(13)
-                    width, height, bit_depth, color_type = struct.unpack('>IIBB', ihdr_data[:10])
-
-                    # Calculate bytes per pixel based on bit depth and color type
-                    if color_type == 0:  # Grayscale
-                        bytes_per_pixel = bit_depth // 8
-                    elif color_type == 2:  # RGB
-                        bytes_per_pixel = (bit_depth // 8) * 3
-                    elif color_type == 3:  # Indexed-color
-                        bytes_per_pixel = 1
-                    elif color_type == 4:  # Grayscale with alpha
-                        bytes_per_pixel = (bit_depth // 8) * 2
-                    elif color_type == 6:  # RGB with alpha
-                        bytes_per_pixel = (bit_depth // 8) * 4
-                    else:
-                        print(f"Unsupported color type: {color_type}")
-                        return None, None, None
-
-                    print(f"Width: {width}, Height: {height}, Bit Depth: {bit_depth}, Color Type: {color_type}, Bytes per Pixel: {bytes_per_pixel}")
-                    return width, height, bytes_per_pixel
-                
-                # Skip the chunk data and the CRC (chunk length + 4 bytes for CRC)
-                file.seek(chunk_length + 4, 1)
-
-    except FileNotFoundError:
-        print(f"Error: File '{png_file}' not found.")
-    except Exception as e:
-        print(f"Error processing PNG file: {e}")
-    
-    return None, None, None
+    # IHDR must be the first chunk, so its data always starts at offset 16
+    if len(file_data) < 8 + 8 + 13 or file_data[12:16] != b'IHDR':
+        print("Error: IHDR chunk not found at offset 8.")
+        return None, None, None, None
+    print("[i] Found IHDR chunk at offset 8")
+    width, height, bit_depth, color_type = struct.unpack_from('>IIBB', file_data, 16)
+
+    # Number of samples per pixel for each color type
+    channels = {
+        0: 1,  # Grayscale
+        2: 3,  # RGB
+        3: 1,  # Indexed-color
+        4: 2,  # Grayscale with alpha
+        6: 4,  # RGB with alpha
+    }.get(color_type)
+    if channels is None:
+        print(f"Unsupported color type: {color_type}")
+        return None, None, None, None
+
+    # Filters work on whole bytes, so sub-byte pixels still count as one byte
+    bits_per_pixel = bit_depth * channels
+    bytes_per_pixel = max(1, bits_per_pixel // 8)
+    stride = (width * bits_per_pixel + 7) // 8  # Scanline length without the filter byte
+
+    print(f"Width: {width}, Height: {height}, Bit Depth: {bit_depth}, Color Type: {color_type}, Bytes per Pixel: {bytes_per_pixel}")
+    return width, height, bytes_per_pixel, stride
 
 
 def main():
@@ -213,11 +279,25 @@ def main():
     # Step 1: Read the PNG file and extract IDAT chunks
     try:
         with open(args.file, 'rb') as f:
-            file_data = f.read()
+            try:
+                # Map the file rather than reading it; the mapping outlives the file object
+                file_data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            except (ValueError, OSError):
+                # Empty files, pipes and FIFOs can't be mapped
+                file_stat = os.fstat(f.fileno())
+                if stat.S_ISREG(file_stat.st_mode) and file_stat.st_size == 0:
+                    print(f"Error: File '{args.file}' is empty.")
+                    return
+                file_data = memoryview(f.read())
     except FileNotFoundError:
         print(f"Error: File '{args.file}' not found.")
         return
 
+    # Step x: Check the PNG signature once; the helpers below assume a PNG
+    if file_data[:len(PNG_SIGNATURE)] != PNG_SIGNATURE:
+        print("Error: The file is not a valid PNG.")
+        return
+
     # Step x: Create directory for artifacts
     artifacts_dir= f"_{args.file.split('.')[0]}"
     os.makedirs(artifacts_dir, exist_ok=True)
@@ -230,11 +310,26 @@ def main():
         for i, (chunk_data, crc32_bytes) in enumerate(idat_chunks):
             idat_output_file = os.path.join(chunks_subdir, f"idat_chunk_{i + 1:03d}.bin")
             crc32_output_file = os.path.join(chunks_subdir, f"idat_chunk_{i + 1:03d}_crc32.bin")
-            write_result_to_file(b"IDAT" + chunk_data, idat_output_file)
+            write_result_to_file([b"IDAT", chunk_data], idat_output_file)
             write_result_to_file(crc32_bytes, crc32_output_file)
 
+    # Step x: Read the image dimensions so the decompressed size is known up front
+    width, height, bytes_per_pixel, stride = get_png_ihdr_info(file_data)
+    max_output_len = height * (1 + stride) if stride is not None else None
+
+    # Step x: When only the unfiltered image is wanted, unfilter scanlines as they are decompressed
+    if args.unfilter and not args.decompress and stride is not None:
+        unfiltered_data = decompress_and_unfilter_idat_chunks(idat_chunks, width, bytes_per_pixel, height, args.verbose, stride)
+        if unfiltered_data is None:
+            print("Error: Decompression or unfiltering failed. Exiting.")
+            return
+
+        unfiltered_output_file = f"idat_unfiltered.bin"
+        write_result_to_file(unfiltered_data, unfiltered_output_file, artifacts_dir)
+        return
+
     # Step 3: Decompress the IDAT chunks
-    decompressed_data = decompress_idat_chunks(idat_chunks)
+    decompressed_data = decompress_idat_chunks(idat_chunks, max_output_len)
     if decompressed_data is None:
         print("Error: Decompression failed. Exiting.")
         return
@@ -244,15 +339,17 @@ def main():
         decompressed_output_file= f"idat_uncompressed.bin"
         write_result_to_file(decompressed_data, decompressed_output_file, artifacts_dir)
 
-    # Step 4: Extract width, height, and bytes_per_pixel from the PNG file for unfiltering
-    width, height, bytes_per_pixel = get_png_ihdr_info(args.file)
+    # Step 4: Check width, height, and bytes_per_pixel from the PNG file for unfiltering
     if width is None or height is None or bytes_per_pixel is None:
         print("Error: Failed to extract IHDR information from the PNG file. Exiting.")
         return
 
     # Step 5: If unfiltering is required, perform unfiltering
     if args.unfilter:
-        unfiltered_data = unfilter_idat_data(decompressed_data, width, bytes_per_pixel, height, args.verbose)
+        unfiltered_data = unfilter_idat_data(decompressed_data, width, bytes_per_pixel, height, args.verbose, stride)
+        if unfiltered_data is None:
+            print("Error: Unfiltering failed. Exiting.")
+            return
 
         # Save the unfiltered data to a new file with "_unfiltered" suffix
         unfiltered_output_file = f"idat_unfiltered.bin"
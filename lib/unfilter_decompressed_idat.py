@@ -1,4 +1,15 @@
-def unfilter_scanlines(decompressed_data, width, bytes_per_pixel, height, verbose= False):
+# NumPy is optional; without it the scanlines are unfiltered byte by byte in Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Numba is optional too; it compiles the filters whose bytes depend on the previous pixel.
+# It is slow to import, so it is only loaded (see _load_jit) for images of at least JIT_MIN_SIZE bytes
+JIT_MIN_SIZE = 4 * 1024 * 1024
+_jit = None  # (sub, average, paeth) kernels once loaded, False if Numba is not installed
+
+def unfilter_scanlines(decompressed_data, width, bytes_per_pixel, height, verbose= False, stride=None):
     """
     Unfilters the scanlines of a decompressed PNG data based on their filter type.
 
@@ -6,11 +17,23 @@ def unfilter_scanlines(decompressed_data, width, bytes_per_pixel, height, verbos
     :param width: The width of the image in pixels.
     :param bytes_per_pixel: The number of bytes representing a single pixel.
     :param height: The height of the image (number of scanlines).
-    :return: The reconstructed image data after unfiltering.
+    :param stride: Bytes per scanline without the filter byte; defaults to width * bytes_per_pixel.
+    :return: The reconstructed image data after unfiltering; raises ValueError if scanlines are missing.
     """
-    stride = width * bytes_per_pixel  # Number of bytes in a scanline without the filter byte
+    if stride is None:
+        stride = width * bytes_per_pixel  # Number of bytes in a scanline without the filter byte
+
+    # Check the data really holds every scanline before sizing the output from the IHDR dimensions
+    if len(decompressed_data) < height * (1 + stride):
+        raise ValueError(f"Decompressed data ends after {len(decompressed_data) // (1 + stride)} of {height} scanlines")
+
+    if np is not None:
+        return unfilter_scanlines_numpy(decompressed_data, bytes_per_pixel, height, stride, verbose)
+
     index = 0  # Position in the decompressed data
-    reconstructed_image = bytearray()  # To hold the final unfiltered image data
+    reconstructed_image = bytearray(height * stride)  # To hold the final unfiltered image data
+    image_view = memoryview(reconstructed_image)
+    prev_scanline = None  # The previous reconstructed scanline, kept instead of slicing it back out
 
     # Loop through each scanline
     for scanline_number in range(height):
@@ -27,70 +50,259 @@ def unfilter_scanlines(decompressed_data, width, bytes_per_pixel, height, verbos
             print(f"Scanline {scanline_number}: Filter Type = {filter_type}")
 
         # Unfilter the scanline based on the filter type
-        if filter_type == 0:  # None
-            reconstructed_scanline = scanline_data
-        elif filter_type == 1:  # Sub
-            reconstructed_scanline = unfilter_sub(scanline_data, bytes_per_pixel)
-        elif filter_type == 2:  # Up
-            prev_scanline = reconstructed_image[-stride:] if reconstructed_image else None
-            reconstructed_scanline = unfilter_up(scanline_data, prev_scanline)
-        elif filter_type == 3:  # Average
-            prev_scanline = reconstructed_image[-stride:] if reconstructed_image else None
-            reconstructed_scanline = unfilter_average(scanline_data, prev_scanline, bytes_per_pixel)
-        elif filter_type == 4:  # Paeth
-            prev_scanline = reconstructed_image[-stride:] if reconstructed_image else None
-            reconstructed_scanline = unfilter_paeth(scanline_data, prev_scanline, bytes_per_pixel)
-        else:
-            raise ValueError(f"Unknown filter type: {filter_type}")
+        reconstructed_scanline = unfilter_row(filter_type, scanline_data, prev_scanline, bytes_per_pixel)
 
-        # Add the reconstructed scanline to the image data
-        reconstructed_image.extend(reconstructed_scanline)
+        # Store the reconstructed scanline in its slot of the image data
+        start = scanline_number * stride
+        image_view[start:start + stride] = reconstructed_scanline
+        prev_scanline = reconstructed_scanline
 
     return reconstructed_image
 
 
+def unfilter_scanlines_numpy(decompressed_data, bytes_per_pixel, height, stride, verbose= False):
+    """
+    Unfilters the scanlines with NumPy, looping over rows instead of bytes.
+
+    :param decompressed_data: The decompressed raw data of the PNG file.
+    :param bytes_per_pixel: The number of bytes representing a single pixel.
+    :param height: The height of the image (number of scanlines).
+    :param stride: The number of bytes in a scanline without the filter byte.
+    :return: The reconstructed image data after unfiltering.
+    """
+    filtered = np.frombuffer(decompressed_data, dtype=np.uint8, count=height * (1 + stride)).reshape(height, 1 + stride)
+    filter_types = filtered[:, 0]
+    zero_row = np.zeros(stride, dtype=np.uint8)  # Stands in for the row above the first scanline
+
+    kernels = _load_jit() if height * stride >= JIT_MIN_SIZE else None
+
+    # Unfilter in place inside the output buffer; uint8 arithmetic wraps mod 256
+    reconstructed_image = bytearray(height * stride)
+    data = np.frombuffer(reconstructed_image, dtype=np.uint8).reshape(height, stride)
+    data[:] = filtered[:, 1:]
+
+    for scanline_number in range(height):
+        filter_type = filter_types[scanline_number]
+
+        if verbose:
+            print(f"Scanline {scanline_number}: Filter Type = {filter_type}")
+
+        prev_row = data[scanline_number - 1] if scanline_number else zero_row
+        unfilter_row_numpy(filter_type, data[scanline_number], prev_row, bytes_per_pixel, kernels)
+
+    return reconstructed_image
+
+
+def unfilter_scanlines_stream(decompressed_pieces, width, bytes_per_pixel, height, verbose= False, stride=None):
+    """
+    Unfilters scanlines as the decompressed data arrives, so the whole decompressed stream is never held.
+
+    :param decompressed_pieces: An iterable of decompressed data pieces of any size.
+    :param width: The width of the image in pixels.
+    :param bytes_per_pixel: The number of bytes representing a single pixel.
+    :param height: The height of the image (number of scanlines).
+    :param stride: Bytes per scanline without the filter byte; defaults to width * bytes_per_pixel.
+    :return: The reconstructed image data after unfiltering.
+    """
+    if stride is None:
+        stride = width * bytes_per_pixel  # Number of bytes in a scanline without the filter byte
+
+    reconstructed_image = bytearray(height * stride)
+    image_view = memoryview(reconstructed_image)
+    if np is not None:
+        data = np.frombuffer(reconstructed_image, dtype=np.uint8).reshape(height, stride)
+        zero_row = np.zeros(stride, dtype=np.uint8)  # Stands in for the row above the first scanline
+        kernels = _load_jit() if height * stride >= JIT_MIN_SIZE else None
+
+    pending = bytearray()  # Decompressed bytes not yet unfiltered, at most one partial scanline
+    prev_scanline = None  # The previous reconstructed scanline (pure-Python path only)
+    scanline_number = 0
+    for piece in decompressed_pieces:
+        pending += piece
+
+        while len(pending) > stride and scanline_number < height:
+            filter_type = pending[0]
+            start = scanline_number * stride
+
+            if verbose:
+                print(f"Scanline {scanline_number}: Filter Type = {filter_type}")
+
+            if np is not None:
+                image_view[start:start + stride] = pending[1:stride + 1]
+                prev_row = data[scanline_number - 1] if scanline_number else zero_row
+                unfilter_row_numpy(filter_type, data[scanline_number], prev_row, bytes_per_pixel, kernels)
+            else:
+                reconstructed_scanline = unfilter_row(filter_type, pending[1:stride + 1], prev_scanline, bytes_per_pixel)
+                image_view[start:start + stride] = reconstructed_scanline
+                prev_scanline = reconstructed_scanline
+
+            del pending[:stride + 1]
+            scanline_number += 1
+
+    if scanline_number < height:
+        raise ValueError(f"Decompressed data ends after {scanline_number} of {height} scanlines")
+
+    return reconstructed_image
+
+
+def unfilter_row_numpy(filter_type, row, prev_row, bytes_per_pixel, kernels=None):
+    """
+    Unfilters one scanline in place; uint8 arithmetic wraps mod 256.
+
+    :param filter_type: The filter type byte of the scanline.
+    :param row: The scanline data as a uint8 array, overwritten with the reconstructed bytes.
+    :param prev_row: The reconstructed previous scanline (all zeros for the first one).
+    :param bytes_per_pixel: The number of bytes representing a single pixel.
+    :param kernels: The compiled (sub, average, paeth) kernels from _load_jit, or None.
+    """
+    if filter_type == 0:  # None
+        pass
+    elif filter_type == 1:  # Sub
+        if kernels is not None:
+            kernels[0](row, bytes_per_pixel)
+        else:
+            # Each byte adds the one bytes_per_pixel to its left: a running sum per channel
+            pixels = row.reshape(-1, bytes_per_pixel)
+            np.cumsum(pixels, axis=0, dtype=np.uint8, out=pixels)
+    elif filter_type == 2:  # Up
+        row += prev_row
+    elif filter_type == 3 and kernels is not None:  # Average
+        kernels[1](row, prev_row, bytes_per_pixel)
+    elif filter_type == 4 and kernels is not None:  # Paeth
+        kernels[2](row, prev_row, bytes_per_pixel)
+    elif filter_type == 3:  # Average
+        # Depends on the previously reconstructed byte, so it can't be vectorized along the row
+        row[:] = np.frombuffer(unfilter_average(row.tobytes(), prev_row.tobytes(), bytes_per_pixel), dtype=np.uint8)
+    elif filter_type == 4:  # Paeth
+        row[:] = np.frombuffer(unfilter_paeth(row.tobytes(), prev_row.tobytes(), bytes_per_pixel), dtype=np.uint8)
+    else:
+        raise ValueError(f"Unknown filter type: {filter_type}")
+
+
+# Row kernels compiled by _load_jit
+def _unfilter_sub_kernel(row, bytes_per_pixel):
+    for i in range(bytes_per_pixel, row.size):
+        row[i] = (row[i] + row[i - bytes_per_pixel]) & 0xFF
+
+def _unfilter_average_kernel(row, prev_row, bytes_per_pixel):
+    for i in range(min(bytes_per_pixel, row.size)):
+        row[i] = (row[i] + (np.int32(prev_row[i]) >> 1)) & 0xFF
+    for i in range(bytes_per_pixel, row.size):
+        row[i] = (row[i] + ((np.int32(row[i - bytes_per_pixel]) + prev_row[i]) >> 1)) & 0xFF
+
+def _unfilter_paeth_kernel(row, prev_row, bytes_per_pixel):
+    for i in range(row.size):
+        # a = left, b = above, c = upper-left
+        b = np.int32(prev_row[i])
+        if i >= bytes_per_pixel:
+            a = np.int32(row[i - bytes_per_pixel])
+            c = np.int32(prev_row[i - bytes_per_pixel])
+        else:
+            a = np.int32(0)
+            c = np.int32(0)
+        pa = abs(b - c)
+        pb = abs(a - c)
+        pc = abs(a + b - 2 * c)
+        if pa <= pb and pa <= pc:
+            predictor = a
+        elif pb <= pc:
+            predictor = b
+        else:
+            predictor = c
+        row[i] = (row[i] + predictor) & 0xFF
+
+
+def _load_jit():
+    """
+    Imports Numba and compiles the row kernels on first use, from explicit signatures (cached on disk).
+
+    :return: The (sub, average, paeth) kernels, or None if Numba is not installed.
+    """
+    global _jit
+    if _jit is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _jit = False
+        else:
+            row_signature = 'void(uint8[::1], int64)'
+            rows_signature = 'void(uint8[::1], uint8[::1], int64)'
+            _jit = (njit(row_signature, cache=True, boundscheck=False)(_unfilter_sub_kernel),
+                    njit(rows_signature, cache=True, boundscheck=False)(_unfilter_average_kernel),
+                    njit(rows_signature, cache=True, boundscheck=False)(_unfilter_paeth_kernel))
+    return _jit or None
+
+
+def unfilter_row(filter_type, scanline, prev_scanline, bytes_per_pixel):
+    """
+    Unfilters one scanline based on its filter type.
+
+    :param filter_type: The filter type byte of the scanline.
+    :param scanline: The scanline data (excluding the filter type).
+    :param prev_scanline: The reconstructed previous scanline, or None for the first one.
+    :param bytes_per_pixel: The number of bytes representing a single pixel.
+    :return: The reconstructed scanline.
+    """
+    if filter_type == 0:  # None
+        return scanline
+    elif filter_type == 1:  # Sub
+        return unfilter_sub(scanline, bytes_per_pixel)
+    elif filter_type == 2:  # Up
+        return unfilter_up(scanline, prev_scanline)
+    elif filter_type == 3:  # Average
+        return unfilter_average(scanline, prev_scanline, bytes_per_pixel)
+    elif filter_type == 4:  # Paeth
+        return unfilter_paeth(scanline, prev_scanline, bytes_per_pixel)
+    else:
+        raise ValueError(f"Unknown filter type: {filter_type}")
+
+
 # Helper functions to handle each filter type
+# Each helper copies the scanline into a preallocated bytearray and reconstructs it in place
 def unfilter_sub(scanline, bytes_per_pixel):
-    result = bytearray()
-    for i in range(len(scanline)):
-        if i < bytes_per_pixel:
-            result.append(scanline[i])  # No left byte, so it's the same
-        else:
-            result.append((scanline[i] + result[i - bytes_per_pixel]) % 256)
+    result = bytearray(scanline)  # The first bytes_per_pixel bytes have no left byte, so they're the same
+    for i in range(bytes_per_pixel, len(result)):
+        result[i] = (result[i] + result[i - bytes_per_pixel]) & 0xFF
     return result
 
 def unfilter_up(scanline, prev_scanline):
     if not prev_scanline:
         return scanline  # No previous scanline, so it's the same
-    return bytearray((scanline[i] + prev_scanline[i]) % 256 for i in range(len(scanline)))
+    result = bytearray(scanline)
+    for i in range(len(result)):
+        result[i] = (result[i] + prev_scanline[i]) & 0xFF
+    return result
 
 def unfilter_average(scanline, prev_scanline, bytes_per_pixel):
-    result = bytearray()
-    for i in range(len(scanline)):
-        left = result[i - bytes_per_pixel] if i >= bytes_per_pixel else 0
-        up = prev_scanline[i] if prev_scanline else 0
-        result.append((scanline[i] + (left + up) // 2) % 256)
+    prev_scanline = prev_scanline or bytes(len(scanline))
+    result = bytearray(scanline)
+    for i in range(min(bytes_per_pixel, len(result))):
+        result[i] = (result[i] + (prev_scanline[i] >> 1)) & 0xFF  # No left byte
+    for i in range(bytes_per_pixel, len(result)):
+        result[i] = (result[i] + ((result[i - bytes_per_pixel] + prev_scanline[i]) >> 1)) & 0xFF
     return result
 
 def unfilter_paeth(scanline, prev_scanline, bytes_per_pixel):
-    def paeth_predictor(a, b, c):
+    prev_scanline = prev_scanline or bytes(len(scanline))
+
+    # With no left pixel (a = c = 0) the predictor is always the byte above
+    result = bytearray(scanline)
+    for i in range(min(bytes_per_pixel, len(result))):
+        result[i] = (result[i] + prev_scanline[i]) & 0xFF
+
+    # The Paeth predictor is inlined; a function call per byte costs more than the comparisons
+    for i in range(bytes_per_pixel, len(result)):
         # a = left, b = above, c = upper-left
-        p = a + b - c
-        pa = abs(p - a)
-        pb = abs(p - b)
-        pc = abs(p - c)
+        a = result[i - bytes_per_pixel]
+        b = prev_scanline[i]
+        c = prev_scanline[i - bytes_per_pixel]
+        pa = abs(b - c)  # |p - a| with p = a + b - c
+        pb = abs(a - c)  # |p - b|
+        pc = abs(a + b - c - c)  # |p - c|
         if pa <= pb and pa <= pc:
-            return a
+            result[i] = (result[i] + a) & 0xFF
         elif pb <= pc:
-            return b
+            result[i] = (result[i] + b) & 0xFF
         else:
-            return c
-
-    result = bytearray()
-    for i in range(len(scanline)):
-        left = result[i - bytes_per_pixel] if i >= bytes_per_pixel else 0
-        up = prev_scanline[i] if prev_scanline else 0
-        upper_left = prev_scanline[i - bytes_per_pixel] if prev_scanline and i >= bytes_per_pixel else 0
-        result.append((scanline[i] + paeth_predictor(left, up, upper_left)) % 256)
+            result[i] = (result[i] + c) & 0xFF
     return result
-